@@ -0,0 +1,42 @@
+# _clients.py
+
+# Shared, cached clients for the embedding model and the Chroma vector store.
+# Both db_manager.py and query_rag.py import from here, so when they run in
+# the same process (e.g. behind a web server) they share one embedding model
+# and one Chroma connection instead of duplicating them.
+
+from functools import lru_cache
+
+import torch
+from langchain_chroma import Chroma
+from langchain_huggingface import HuggingFaceEmbeddings
+
+# --- Configuration ---
+CHROMA_DB_DIRECTORY = "chroma_db"
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+@lru_cache(maxsize=1)
+def get_embeddings():
+    """
+    Returns the process-wide HuggingFace embeddings client, creating it on
+    first use. Model weights are only loaded once per process.
+    """
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    print(f"    -> Using '{device}' for embeddings.")
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs={'device': device}
+    )
+
+
+@lru_cache(maxsize=1)
+def get_vector_store():
+    """
+    Returns the process-wide Chroma vector store backed by the persistent
+    database directory, creating it on first use.
+    """
+    return Chroma(
+        persist_directory=CHROMA_DB_DIRECTORY,
+        embedding_function=get_embeddings()
+    )
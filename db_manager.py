@@ -1,20 +1,23 @@
 # db_manager.py
 
+import asyncio
+import hashlib
+import io
+import json
 import os
-import glob
+from functools import lru_cache
 from typing import List
 
-# We use the langchain_community library for document loading and text splitting.
-# PyPDFLoader is for .pdf files.
+# Heavy loader dependencies (pypdf, `unstructured`) are imported lazily inside
+# the loaders below, so a sync with nothing to do doesn't pay their import cost.
+# _InMemoryPDFLoader (below, built on pypdf) is for .pdf files.
 # UnstructuredWordDocumentLoader is for .docx files (requires the `unstructured` library).
-# TextLoader is for .txt files.
-from langchain_community.document_loaders import PyPDFLoader, UnstructuredWordDocumentLoader, TextLoader
-from langchain_chroma import Chroma
-import torch
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+# _FastTextLoader is for .txt files.
 from langchain_core.documents import Document
 
+# Embeddings and the Chroma client are shared with query_rag.py via _clients.
+from _clients import CHROMA_DB_DIRECTORY, get_vector_store
+
 # Note: For .docx files, you may need to install the 'unstructured' library.
 # To do so, run the following command:
 # pip install "unstructured[local-inference]"
@@ -22,25 +25,181 @@ from langchain_core.documents import Document
 # --- Configuration ---
 # Define the file paths.
 DOCS_DIRECTORY = "docs"
-CHROMA_DB_DIRECTORY = "chroma_db"
+# How many chunks to send to the vector store per add_documents call.
+ADD_BATCH_SIZE = 200
+# How many embedding/insert batches may be in flight at once.
+MAX_CONCURRENT_ADDS = 4
 
 # --- Helper Functions ---
 
+@lru_cache(maxsize=1)
+def _get_text_splitter():
+    """
+    Returns the shared text splitter, importing and building it on first use so
+    the separator cascade is only initialized once and only when needed.
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        length_function=len,
+        is_separator_regex=False,
+    )
+
+def _list_docs(dirpath: str) -> List[str]:
+    """
+    Returns the paths of all supported documents in a directory using a single
+    os.scandir pass instead of one case-insensitive glob per extension.
+    """
+    exts = ('.pdf', '.docx', '.txt')
+    with os.scandir(dirpath) as it:
+        return [
+            os.path.join(dirpath, entry.name)
+            for entry in it
+            if entry.is_file() and entry.name.lower().endswith(exts)
+        ]
+
+class _InMemoryPDFLoader:
+    """
+    Loads a PDF by reading the whole file into memory first, then parsing the
+    bytes with pypdf. The PDF parser otherwise issues many small seek/read
+    calls, which is slow when the docs directory lives on a network mount.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def load(self) -> List[Document]:
+        from pypdf import PdfReader
+
+        # One large sequential read (1 MiB buffer) instead of parser-driven seeks.
+        with open(self.file_path, 'rb', buffering=1 << 20) as fh:
+            data = fh.read()
+        reader = PdfReader(io.BytesIO(data))
+        return [
+            Document(
+                page_content=page.extract_text() or "",
+                metadata={'source': self.file_path, 'page': page_number},
+            )
+            for page_number, page in enumerate(reader.pages)
+        ]
+
+def _ingested_index_path() -> str:
+    return os.path.join(CHROMA_DB_DIRECTORY, "ingested.json")
+
+def _load_ingested(vector_store) -> dict:
+    """
+    Returns the {source path: content hash} index of ingested files. Normally
+    read from the sidecar JSON next to the database, which keeps sync cost
+    O(files); databases created before the sidecar existed are rebuilt once
+    from chunk metadata.
+    """
+    try:
+        with open(_ingested_index_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        db_docs = vector_store.get(include=['metadatas'])
+        return {
+            metadata.get('source'): metadata.get('source_hash')
+            for metadata in db_docs['metadatas']
+        }
+
+def _save_ingested(index: dict):
+    """
+    Writes the ingested-sources index atomically (write-then-rename) so a
+    crash mid-write can't leave a truncated file behind.
+    """
+    tmp_path = _ingested_index_path() + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, _ingested_index_path())
+
+def _file_sha1(file_path: str) -> str:
+    """
+    Returns the sha1 hex digest of a file's contents, read through a 1 MiB
+    buffer so large files don't pay for thousands of small read syscalls.
+    """
+    with open(file_path, 'rb', buffering=1 << 20) as fh:
+        return hashlib.file_digest(fh, 'sha1').hexdigest()
+
+def _merge_small_chunks(chunks: List[Document], max_size: int = 1150, min_size: int = 200) -> List[Document]:
+    """
+    Greedily merges adjacent undersized chunks produced by the recursive
+    splitter. Section boundaries tend to leave many tiny chunks; every chunk
+    is one embedding request and one Chroma row, so merging them cuts both.
+
+    Adjacent chunks are concatenated while the result stays within `max_size`.
+    A trailing chunk smaller than `min_size` is folded into its predecessor,
+    re-splitting if that pushes it past `max_size`. Metadata is taken from the
+    first constituent of each merged chunk.
+    """
+    if not chunks:
+        return chunks
+
+    merged = []
+    buf_text = chunks[0].page_content
+    buf_meta = chunks[0].metadata
+    for chunk in chunks[1:]:
+        if len(buf_text) + 1 + len(chunk.page_content) <= max_size:
+            buf_text = buf_text + "\n" + chunk.page_content
+        else:
+            merged.append(Document(page_content=buf_text, metadata=buf_meta))
+            buf_text = chunk.page_content
+            buf_meta = chunk.metadata
+    merged.append(Document(page_content=buf_text, metadata=buf_meta))
+
+    # Fold a tiny trailer into the previous chunk so we don't embed fragments.
+    if len(merged) > 1 and len(merged[-1].page_content) < min_size:
+        trailer = merged.pop()
+        previous = merged.pop()
+        combined = previous.page_content + "\n" + trailer.page_content
+        if len(combined) <= max_size:
+            merged.append(Document(page_content=combined, metadata=previous.metadata))
+        else:
+            merged.extend(
+                Document(page_content=text, metadata=previous.metadata)
+                for text in _get_text_splitter().split_text(combined)
+            )
+    return merged
+
+class _FastTextLoader:
+    """
+    TextLoader replacement that reads the file through a 1 MiB buffer in a
+    single read. The default 8 KiB buffering costs one kernel transition per
+    8 KiB, which dominates on large logs and manuals.
+    """
+
+    def __init__(self, file_path: str, encoding: str = None):
+        self.file_path = file_path
+        self.encoding = encoding
+
+    def load(self) -> List[Document]:
+        with open(self.file_path, 'r', encoding=self.encoding, buffering=1 << 20) as f:
+            text = f.read()
+        return [Document(page_content=text, metadata={'source': self.file_path})]
+
 def get_loader(file_path: str):
     """
     Returns the appropriate LangChain document loader based on the file extension.
     """
-    extension = os.path.splitext(file_path)[1].lower()
-    
-    if extension == ".pdf":
-        return PyPDFLoader(file_path)
-    elif extension == ".docx":
+    # str.endswith is a single C-level check; os.path.splitext would allocate
+    # a tuple and search for the last dot on every call.
+    lowered = file_path.lower()
+
+    if lowered.endswith(".pdf"):
+        return _InMemoryPDFLoader(file_path)
+    elif lowered.endswith(".docx"):
+        # Imported here because `unstructured` pulls in nltk/PIL and can take
+        # seconds to load; only pay that when a .docx is actually present.
+        from langchain_community.document_loaders import UnstructuredWordDocumentLoader
+
         # UnstructuredWordDocumentLoader handles both .doc and .docx files.
         return UnstructuredWordDocumentLoader(file_path)
-    elif extension == ".txt":
-        return TextLoader(file_path)
+    elif lowered.endswith(".txt"):
+        return _FastTextLoader(file_path)
     else:
-        print(f"Warning: No loader found for file type '{extension}'. Skipping '{file_path}'.")
+        print(f"Warning: No loader found for '{file_path}'. Skipping.")
         return None
 
 # --- Core Functions ---
@@ -48,108 +207,159 @@ def get_loader(file_path: str):
 def get_db_and_docs_from_disk():
     """
     Initializes or loads a persistent ChromaDB instance and returns it along
-    with a list of all documents in the database.
+    with the {source path: content hash} index of ingested files.
     """
     print("1. Initializing local embeddings...")
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    print(f"    -> Using '{device}' for embeddings.")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="all-MiniLM-L6-v2",
-        model_kwargs={'device': device}
-    )
 
-    # Check if the ChromaDB directory already exists.
-    if not os.path.exists(CHROMA_DB_DIRECTORY):
+    # Check if the ChromaDB directory already exists before the shared client
+    # creates it on first use.
+    is_new_db = not os.path.exists(CHROMA_DB_DIRECTORY)
+    vector_store = get_vector_store()
+
+    if is_new_db:
         print("    -> ChromaDB directory not found. Creating a new database...")
-        # If the directory doesn't exist, we start with an empty vector store
-        # and create the persistence directory.
-        vector_store = Chroma(
-            embedding_function=embeddings,
-            persist_directory=CHROMA_DB_DIRECTORY
-        )
-        return vector_store, []
+        return vector_store, {}
     else:
         print("    -> ChromaDB directory found. Loading existing database...")
-        # If the directory exists, we load the database from disk.
-        vector_store = Chroma(
-            persist_directory=CHROMA_DB_DIRECTORY,
-            embedding_function=embeddings
-        )
-        # Retrieve all documents currently in the database to compare with the file system.
-        db_docs_with_ids = vector_store.get(include=['metadatas'])
-        db_docs = db_docs_with_ids['metadatas']
-        print(f"    -> Found {len(db_docs)} document chunks in the database.")
-        return vector_store, db_docs
+        ingested = _load_ingested(vector_store)
+        print(f"    -> Found {len(ingested)} ingested source files in the database.")
+        return vector_store, ingested
+
+async def _add_with_retry(vector_store, batch: List[Document], ids: List[str], attempts: int = 5):
+    """
+    Adds one batch to the vector store, retrying transient network failures
+    with exponential backoff (1s, 2s, 4s, ... capped at 30s). Without this, a
+    single hiccup mid-sync discards all the embedding work done so far.
+    """
+    delay = 1.0
+    for attempt in range(1, attempts + 1):
+        try:
+            await vector_store.aadd_documents(batch, ids=ids)
+            return
+        except (TimeoutError, ConnectionError) as e:
+            if attempt == attempts:
+                raise
+            print(f"     -> Transient error adding batch ({e}). Retrying in {delay:.0f}s...")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
 
-def add_new_documents(vector_store, new_docs_paths: List[str]):
+async def add_new_documents(vector_store, new_docs_paths: List[str], doc_hashes: dict) -> List[str]:
     """
-    Loads, splits, and adds new documents to the ChromaDB.
+    Loads, splits, and adds new documents to the ChromaDB, returning the paths
+    that were successfully ingested so the sidecar index can be updated.
     This function now supports multiple file types using get_loader().
+
+    `doc_hashes` maps each path to its content sha1; the hash is stamped into
+    chunk metadata so later syncs can tell edited files from unchanged ones.
     """
     if not new_docs_paths:
         print("   -> No new documents to add.")
-        return
+        return []
 
-    print(f"\n2. Found {len(new_docs_paths)} new documents to process:")
-    for doc_path in new_docs_paths:
+    print(f"\n3. Found {len(new_docs_paths)} new or changed documents to process:")
+
+    def _load_and_split(doc_path: str) -> List[Document]:
+        """Loads and splits a single file, returning its chunks.
+
+        Exceptions are caught here so one bad file can't poison the whole batch.
+        """
         print(f"   - Processing: {doc_path}")
-        
+
         # Get the appropriate loader for the file type.
         loader = get_loader(doc_path)
-        
+
         if not loader:
-            continue
-            
+            return []
+
         try:
             # Load the document using the selected loader.
             documents = loader.load()
-            
-            # Use a text splitter to break the document into manageable chunks.
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                length_function=len,
-                is_separator_regex=False,
-            )
-            chunks = text_splitter.split_documents(documents)
-            
-            # Add the original file path to each chunk's metadata. This is crucial
-            # for later tracking and deletion.
+
+            chunks = _merge_small_chunks(_get_text_splitter().split_documents(documents))
+
+            # Add the original file path and content hash to each chunk's
+            # metadata. This is crucial for later tracking and deletion.
             for chunk in chunks:
                 chunk.metadata['source'] = doc_path
-            
-            print(f"     -> Split into {len(chunks)} chunks. Adding to database...")
-            # Add the new documents to the vector store.
-            vector_store.add_documents(chunks)
-            print("     -> Done.")
+                chunk.metadata['source_hash'] = doc_hashes[doc_path]
+
+            print(f"     -> Split '{doc_path}' into {len(chunks)} chunks.")
+            return chunks
         except Exception as e:
             print(f"     -> Error processing {doc_path}: {e}")
+            return []
+
+    # Load and split files in parallel worker threads; PDF/DOCX parsing is
+    # disk- and CPU-latency bound, so multiple files benefit from overlapping
+    # the work, and the event loop stays free for the embedding batches below.
+    results = await asyncio.gather(
+        *[asyncio.to_thread(_load_and_split, path) for path in new_docs_paths]
+    )
+
+    # Accumulate chunks from every file so we can add them to the vector store
+    # in a few large batches instead of one embedding round-trip per file.
+    # Pre-generate deterministic IDs (path hash + content hash + chunk index)
+    # so a re-run after a crash upserts the same rows instead of duplicating
+    # embeddings, while an edited file's chunks get fresh IDs.
+    all_chunks = []
+    all_ids = []
+    for chunks in results:
+        if not chunks:
+            continue
+        source_sha1 = hashlib.sha1(chunks[0].metadata['source'].encode()).hexdigest()
+        content_sha1 = chunks[0].metadata['source_hash']
+        all_ids.extend(f"{source_sha1}:{content_sha1}:{i}" for i in range(len(chunks)))
+        all_chunks.extend(chunks)
+
+    if not all_chunks:
+        print("   -> No chunks produced. Nothing to add.")
+        return []
+
+    # Flush the accumulated chunks in large batches. Each add call is one
+    # embedding request and one Chroma write, so fewer, bigger calls means
+    # fewer round-trips and fewer SQLite flushes inside Chroma. A semaphore
+    # bounds how many batches embed concurrently.
+    print(f"   -> Adding {len(all_chunks)} chunks to the database in batches of {ADD_BATCH_SIZE}...")
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_ADDS)
+
+    async def _add_batch(start: int):
+        async with semaphore:
+            await _add_with_retry(
+                vector_store,
+                all_chunks[start:start + ADD_BATCH_SIZE],
+                all_ids[start:start + ADD_BATCH_SIZE],
+            )
+
+    await asyncio.gather(
+        *[_add_batch(start) for start in range(0, len(all_chunks), ADD_BATCH_SIZE)]
+    )
+    print("   -> Done.")
+    return [path for path, chunks in zip(new_docs_paths, results) if chunks]
 
 def remove_deleted_documents(vector_store, documents_to_delete_paths: List[str]):
     """
     Removes documents from the ChromaDB that no longer exist in the file system.
+
+    Deletion is filtered server-side with a `where` clause on the source
+    metadata, so no chunk IDs or metadata need to be materialized client-side.
     """
     if not documents_to_delete_paths:
         print("   -> No documents to remove.")
         return
 
-    print(f"\n3. Found {len(documents_to_delete_paths)} documents to remove from the database:")
-    
-    # Retrieve all documents in the database to get their IDs.
-    db_docs = vector_store.get(include=['metadatas'])
-    
-    # Get a list of all IDs for documents that need to be deleted.
-    ids_to_delete = []
+    print(f"\n2. Found {len(documents_to_delete_paths)} documents to remove from the database:")
     for doc_path in documents_to_delete_paths:
         print(f"   - Deleting embeddings for: {doc_path}")
-        for i, metadata in enumerate(db_docs['metadatas']):
-            if metadata.get('source') == doc_path:
-                ids_to_delete.append(db_docs['ids'][i])
-    
-    # Perform the deletion if any IDs were found.
-    if ids_to_delete:
-        vector_store.delete(ids=ids_to_delete)
-        print(f"     -> Deleted {len(ids_to_delete)} chunks.")
+
+    try:
+        # One predicate delete covering every removed file.
+        vector_store._collection.delete(
+            where={"source": {"$in": documents_to_delete_paths}}
+        )
+    except Exception:
+        # Older Chroma versions may not support $in; fall back to per-path deletes.
+        for doc_path in documents_to_delete_paths:
+            vector_store._collection.delete(where={"source": doc_path})
     print("   -> Done.")
 
 def sync_vector_db():
@@ -157,34 +367,49 @@ def sync_vector_db():
     Compares the files in the docs directory with the documents in the ChromaDB
     and updates the database accordingly.
     """
-    # Get the current list of files in the docs directory.
-    current_docs_paths = glob.glob(os.path.join(DOCS_DIRECTORY, "*.[pP][dD][fF]"))
-    current_docs_paths.extend(glob.glob(os.path.join(DOCS_DIRECTORY, "*.[dD][oO][cC][xX]")))
-    current_docs_paths.extend(glob.glob(os.path.join(DOCS_DIRECTORY, "*.[tT][xX][tT]")))
-    
-    # Get the existing database and its documents.
-    vector_store, db_docs = get_db_and_docs_from_disk()
-
-    # Create a set of all document paths currently in the database.
-    db_doc_paths = set(metadata.get('source') for metadata in db_docs)
-    
-    # Find new documents to add.
-    new_docs_paths = [path for path in current_docs_paths if path not in db_doc_paths]
-    
-    # Find documents to delete.
-    current_docs_set = set(current_docs_paths)
-    documents_to_delete_paths = [path for path in db_doc_paths if path not in current_docs_set]
-
-    # Add new documents to the database.
-    add_new_documents(vector_store, new_docs_paths)
-    
-    # Remove old documents from the database.
+    # Get the current list of files in the docs directory and hash their
+    # contents, so edits and renames are detected rather than just new paths.
+    current_docs_paths = _list_docs(DOCS_DIRECTORY)
+    current_hashes = {path: _file_sha1(path) for path in current_docs_paths}
+
+    # Get the existing database and its ingested-sources index. The index maps
+    # source path to content hash and comes from the sidecar JSON, so sync is
+    # O(files) instead of materializing every chunk's metadata.
+    vector_store, db_hash_by_source = get_db_and_docs_from_disk()
+
+    # Classify each file: unchanged (path and hash match) -> skip, edited
+    # (path matches, hash differs) -> delete stale chunks then re-add, new
+    # path -> add. Files gone from disk are deleted.
+    new_docs_paths = [
+        path for path in current_docs_paths
+        if db_hash_by_source.get(path) != current_hashes[path]
+    ]
+    documents_to_delete_paths = [
+        path for path in db_hash_by_source
+        if path not in current_hashes or db_hash_by_source[path] != current_hashes[path]
+    ]
+
+    # Remove stale chunks first so edited files aren't duplicated on re-add.
     remove_deleted_documents(vector_store, documents_to_delete_paths)
-    
+
+    # Add new and edited documents to the database.
+    added_paths = asyncio.run(add_new_documents(vector_store, new_docs_paths, current_hashes))
+
+    # Persist the updated index: drop what was deleted, record what was added.
+    deleted = set(documents_to_delete_paths)
+    ingested = {
+        path: content_hash
+        for path, content_hash in db_hash_by_source.items()
+        if path not in deleted
+    }
+    for path in added_paths:
+        ingested[path] = current_hashes[path]
+    _save_ingested(ingested)
+
     print("\n--- Database sync complete. ---")
 
     # Final check on the number of chunks in the database
-    final_count = len(vector_store.get(include=['metadatas'])['metadatas'])
+    final_count = vector_store._collection.count()
     print(f"--- Final check: {final_count} chunks in the database. ---")
 
 # --- Main Execution ---
@@ -2,14 +2,14 @@
 
 import os
 import getpass
+
 from dotenv import load_dotenv
-import torch
 
-# We use the langchain_community library for document loading, embeddings, and vector stores.
-from langchain_chroma import Chroma
 from langchain_google_genai import GoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.chains import RetrievalQA
+from langchain_core.prompts import PromptTemplate
+
+# Embeddings and the Chroma client are shared with db_manager.py via _clients.
+from _clients import get_vector_store
 
 # --- Configuration ---
 # Load environment variables from the .env file.
@@ -22,10 +22,21 @@ if not google_api_key:
     google_api_key = getpass.getpass("Enter your Google API Key: ")
     os.environ["GOOGLE_API_KEY"] = google_api_key
 
-# Define the file paths and model names.
-CHROMA_DB_DIRECTORY = "chroma_db"
+# Define the model names.
 GENERATION_MODEL_NAME = "models/gemini-2.5-flash"
 
+# Initialize the Gemini model once at module scope; every question reuses it.
+llm = GoogleGenerativeAI(model=GENERATION_MODEL_NAME)
+
+# Build the prompt template once; each question only fills in the variables.
+PROMPT = PromptTemplate.from_template(
+    "Use the following context to answer the question. If the answer is not "
+    "in the context, say you don't know.\n\n"
+    "Context:\n{context}\n\n"
+    "Question: {question}\n"
+    "Answer:"
+)
+
 
 # --- Core Functions ---
 
@@ -35,19 +46,9 @@ def load_vector_store():
     """
     try:
         print("1. Initializing HuggingFace embeddings...")
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        print(f"    -> Using '{device}' for embeddings.")
-        embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",
-            model_kwargs={'device': device}
-        )
-
         print("2. Loading vector store from disk...")
-        # Load the existing database using the same persistence directory.
-        vector_store = Chroma(
-            persist_directory=CHROMA_DB_DIRECTORY,
-            embedding_function=embeddings
-        )
+        # The shared client loads the database from the persistence directory.
+        vector_store = get_vector_store()
         print("   -> Vector store successfully loaded!")
         return vector_store
     
@@ -71,25 +72,15 @@ def ask_question_with_rag(query: str, vector_store, k_chunks: int = 4):
     print(f"User Question: '{query}'")
     print(f"Retrieving top {k_chunks} relevant chunks...")
 
-    # Configure the retriever to use the vector store and return a specific number of chunks (k).
-    retriever = vector_store.as_retriever(search_kwargs={"k": k_chunks})
-
-    # Initialize the Gemini model for content generation.
-    llm = GoogleGenerativeAI(model=GENERATION_MODEL_NAME)
-
-    # Use LangChain's RetrievalQA chain to combine the retrieval and generation steps.
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",
-        retriever=retriever,
-        return_source_documents=True
-    )
+    # Retrieve the relevant chunks directly and stuff them into the prompt.
+    # This skips RetrievalQA's per-call chain construction and gives direct
+    # control over the prompt and token budget.
+    docs = vector_store.similarity_search(query, k=k_chunks)
+    context = "\n\n".join(doc.page_content for doc in docs)
 
     print("Generating response with Gemini...")
-    result = qa_chain.invoke({"query": query})
-    
-    answer = result.get("result")
-    
+    answer = llm.invoke(PROMPT.format(context=context, question=query))
+
     print("\n--- Gemini's Answer ---")
     return answer
 